@@ -1,15 +1,29 @@
 import asyncio
+import atexit
 import csv
 import logging
 import os
+import queue
+import re
 import time
-from datetime import datetime, timezone
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from typing import Dict, List, Set, Tuple, Optional
 
 from telethon import TelegramClient, events, errors
 from telethon.tl.types import Channel  # для проверки типа чата
 
+try:
+    import ahocorasick  # pyahocorasick: поиск всех ключей за один проход по тексту
+except ImportError:  # необязательная зависимость — остаёмся на regex-альтернации
+    ahocorasick = None
+
+try:
+    import uvloop  # event-loop на libuv — заметно быстрее стандартного
+except ImportError:  # необязательная зависимость — остаёмся на asyncio
+    uvloop = None
+
 # ─────────────────────────────── CONFIG ─────────────────────────────── #
 
 API_ID: Optional[int] = int(os.getenv("API_ID", "0")) or None
@@ -23,19 +37,45 @@ keyword_groups: List[dict] = [
     {
         "name": "wallets",
         "keywords_file": "wallets_keywords.txt",
+        "excluded_file": None,  # файл стоп-слов (опционально): по строке на слово
+        # id чатов-источников через запятую; пусто — слушаем все чаты аккаунта
+        "source_chat_ids": [
+            int(cid) for cid in os.getenv("SOURCE_CHAT_IDS", "").replace(" ", "").split(",") if cid
+        ],
         "target_chat_id": int(os.getenv("TARGET_CHAT_ID", "0")),
         "csv_file": "log.csv",
     },
 ]
 
 PROCESSED_TTL = 24 * 60 * 60  # 24 ч — время жизни кэша дубликатов
+SWEEP_INTERVAL = 60  # не чистить кэш дубликатов чаще раза в минуту
+ENTITY_CACHE_MAX = 10_000  # максимум закэшированных сущностей чатов
+CSV_FLUSH_ROWS = 16  # сбрасывать CSV-буфер после стольких строк…
+CSV_FLUSH_INTERVAL = 2.0  # …или спустя столько секунд простоя
+
+# шаблоны уведомления: собираются один раз, в обработчике — только .format()
+ANCHOR_TMPL = '<a href="{link}">Открыть сообщение</a>'
+MATCH_TMPL = (
+    "🚨 Найдено совпадение по адресу:\n<b>{kw}</b>\n"
+    "Оригинал сообщения:\n"
+    "{text}\n"
+    "{anchor}"
+)
 
 # ────────────────────────────── LOGGING ─────────────────────────────── #
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s — %(message)s",
+# записи уходят в очередь в памяти, а форматирует и пишет их фоновый
+# поток — вызов logger.* не блокирует event-loop на выводе
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(
+    logging.Formatter("%(asctime)s [%(levelname)s] %(name)s — %(message)s")
 )
+_log_listener = QueueListener(_log_queue, _log_stream)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(_log_queue)])
 logger = logging.getLogger("parser")
 
 # ───────────────────────────── UTILITIES ────────────────────────────── #
@@ -59,33 +99,116 @@ def load_keywords(path: str) -> Dict[str, str]:
         return {}
 
     mapping: Dict[str, str] = {}
-    with p.open(encoding="utf-8") as fh:
-        for raw in fh:
-            line = raw.strip()
-            if not line or line.startswith("#"):
-                continue
-
-            for sep in ("|", ":", ","):
-                if sep in line:
-                    kw, alias = map(str.strip, line.split(sep, 1))
-                    break
-            else:
-                kw, alias = line, line
+    # читаем файл целиком: один системный вызов + splitlines на уровне C
+    # вместо построчной итерации по файловому объекту
+    for raw in p.read_text(encoding="utf-8").splitlines():
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        for sep in ("|", ":", ","):
+            if sep in line:
+                kw, alias = map(str.strip, line.split(sep, 1))
+                break
+        else:
+            kw, alias = line, line
 
-            mapping[kw.lower()] = alias
+        mapping[kw.lower()] = alias
     return mapping
 
 
-def find_keyword(text: str, kw_map: Dict[str, str]) -> Optional[str]:
+_now_sec = 0
+_now_iso = ""
+
+
+def utc_now_iso() -> str:
+    """
+    Строка UTC-времени в формате ISO с точностью до секунды.
+
+    Пока секунда не сменилась, возвращается закэшированная строка —
+    без создания datetime-объектов на каждое сообщение.
+    """
+    global _now_sec, _now_iso
+    sec = int(time.time())
+    if sec != _now_sec:
+        _now_sec = sec
+        _now_iso = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(sec))
+    return _now_iso
+
+
+def csv_line(ts: str, chat_id: int, msg_id: int, text: str) -> str:
+    """
+    Собирает готовую CSV-строку для лога.
+
+    Схема фиксированная (четыре поля, текст последним), поэтому обходимся
+    одной f-строкой вместо модуля csv с его машиной квотирования.
+    Текст экранируем по RFC 4180: кавычки удваиваем, переводы строк
+    заменяем пробелами.
+    """
+    text = text.replace('"', '""').replace("\n", " ")
+    return f'{ts},{chat_id},{msg_id},"{text}"\n'
+
+
+def compile_excluded(path: Optional[str]) -> Optional["re.Pattern[str]"]:
+    """
+    Компилирует стоп-слова из файла в один паттерн-альтернацию.
+
+    Если паттерн находит совпадение в тексте, уведомление по этому
+    сообщению не отправляется. Файл опционален: None — стоп-слов нет.
+    """
+    if not path:
+        return None
+    words = load_keywords(path)
+    if not words:
+        return None
+    return re.compile("|".join(map(re.escape, sorted(words, key=len, reverse=True))))
+
+
+def compile_keywords(kw_map: Dict[str, str]) -> Optional["re.Pattern[str]"]:
+    """
+    Собирает все ключевые слова в один скомпилированный паттерн-альтернацию.
+
+    Один вызов .search() просматривает текст за один проход на уровне C,
+    вместо отдельной проверки `in` для каждого ключевого слова.
+    Более длинные ключи идут первыми, чтобы выигрывало самое длинное совпадение.
+    """
+    if not kw_map:
+        return None
+    parts = sorted(kw_map, key=len, reverse=True)
+    return re.compile("|".join(map(re.escape, parts)))
+
+
+def build_automaton(kw_map: Dict[str, str]) -> Optional[object]:
+    """
+    Строит автомат Ахо–Корасик по ключевым словам (если установлен
+    pyahocorasick). Автомат находит любое из N ключевых слов за один
+    линейный проход по тексту — без перебора ключей по одному.
+    """
+    if ahocorasick is None or not kw_map:
+        return None
+    automaton = ahocorasick.Automaton()
+    for kw, alias in kw_map.items():
+        automaton.add_word(kw, alias)
+    automaton.make_automaton()
+    return automaton
+
+
+def find_keyword(text_lc: str, group: "GroupData") -> Optional[str]:
     """
     Возвращает псевдоним первого найденного ключевого слова
     или None, если совпадений нет.
+
+    Текст должен быть уже приведён к нижнему регистру: .lower() выделяет
+    новую строку, и вызывающий код делает это один раз на сообщение.
     """
-    text_lc = text.lower()
-    for kw, alias in kw_map.items():
-        if kw in text_lc:
+    if group.automaton is not None:
+        for _, alias in group.automaton.iter(text_lc):
             return alias
-    return None
+        return None
+    if group.pattern is None:
+        return None
+    m = group.pattern.search(text_lc)
+    return group.keywords[m.group(0)] if m else None
 
 
 def tg_link(chat, msg_id: int) -> str:
@@ -110,14 +233,26 @@ class DupCache:
 
     def __init__(self, ttl: int = PROCESSED_TTL):
         self.ttl = ttl
-        self._cache: Dict[Tuple[int, int], float] = {}
+        self._cache: "OrderedDict[Tuple[int, int], float]" = OrderedDict()
+        self._last_sweep = 0.0
 
     def add(self, chat_id: int, msg_id: int) -> bool:
         """True, если такого (chat_id, msg_id) не было за последние ttl секунд."""
         key = (chat_id, msg_id)
-        now = time.time()
-        # чистим просроченные записи
-        self._cache = {k: v for k, v in self._cache.items() if now - v < self.ttl}
+        # monotonic: чуть дешевле и не зависит от переводов системных часов
+        now = time.monotonic()
+        # чистить при каждом сообщении незачем: при TTL в сутки минута
+        # неточности роли не играет, зато сообщения между чистками
+        # обрабатываются без лишней работы
+        if now - self._last_sweep >= SWEEP_INTERVAL:
+            self._last_sweep = now
+            # записи добавляются в порядке времени, поэтому просроченные
+            # скапливаются в начале — снимаем их с головы и останавливаемся
+            while self._cache:
+                oldest = next(iter(self._cache.values()))
+                if now - oldest < self.ttl:
+                    break
+                self._cache.popitem(last=False)
         if key in self._cache:
             return False
         self._cache[key] = now
@@ -125,20 +260,42 @@ class DupCache:
 
 
 class GroupData:
-    __slots__ = ("name", "keywords", "target_chat_id", "csv_writer")
+    __slots__ = (
+        "name",
+        "keywords",
+        "pattern",
+        "automaton",
+        "excluded_pattern",
+        "source_chat_ids",
+        "target_chat_id",
+        "csv_writer",
+    )
 
     def __init__(self, cfg: dict):
         self.name: str = cfg["name"]
         # теперь это Dict[str, str] {keyword: alias}
         self.keywords: Dict[str, str] = load_keywords(cfg["keywords_file"])
+        # единый паттерн по всем ключам — компилируем один раз при старте
+        self.pattern = compile_keywords(self.keywords)
+        # автомат Ахо–Корасик, если доступен pyahocorasick (иначе None)
+        self.automaton = build_automaton(self.keywords)
+        # стоп-слова: одно совпадение — и уведомление не шлём
+        self.excluded_pattern = compile_excluded(cfg.get("excluded_file"))
+        self.source_chat_ids: List[int] = cfg.get("source_chat_ids") or []
         self.target_chat_id: int = cfg["target_chat_id"]
 
         csv_file = cfg.get("csv_file")
         if csv_file:
             path = Path(csv_file)
             path.parent.mkdir(parents=True, exist_ok=True)
-            self.csv_writer = path.open("a", newline="", encoding="utf-8")
-            if path.stat().st_size == 0:
+            # решаем про заголовок до открытия — не перечитываем stat
+            # по уже открытому файлу
+            needs_header = not path.exists() or path.stat().st_size == 0
+            # буфер побольше, чтобы строки уходили на диск крупными блоками
+            self.csv_writer = path.open(
+                "a", newline="", encoding="utf-8", buffering=65536
+            )
+            if needs_header:
                 csv.writer(self.csv_writer).writerow(
                     ["datetime_utc", "chat_id", "message_id", "text"]
                 )
@@ -160,36 +317,107 @@ async def main() -> None:
     groups = [GroupData(cfg) for cfg in keyword_groups]
     dup_cache = DupCache()
 
+    # диспетчеризация по чату-источнику за O(1); группы без явного списка
+    # источников слушают всё (как раньше)
+    group_by_source: Dict[int, GroupData] = {
+        cid: g for g in groups for cid in g.source_chat_ids
+    }
+    catch_all: Optional[GroupData] = next(
+        (g for g in groups if not g.source_chat_ids), None
+    )
+
+    # чаты, куда мы сами шлём уведомления: сообщения оттуда игнорируем,
+    # иначе бот зациклится на собственных алертах
+    target_ids = frozenset(g.target_chat_id for g in groups if g.target_chat_id)
+
+    # кэш сущностей чатов: активные чаты шлют сообщения постоянно,
+    # а get_chat() может стоить RPC — повторные обращения берём из памяти
+    entity_cache: "OrderedDict[int, object]" = OrderedDict()
+
+    async def get_chat_cached(event: events.NewMessage.Event):
+        chat = entity_cache.get(event.chat_id)
+        if chat is None:
+            chat = await event.get_chat()
+            entity_cache[event.chat_id] = chat
+            if len(entity_cache) > ENTITY_CACHE_MAX:
+                entity_cache.popitem(last=False)
+        return chat
+
+    # очередь CSV-строк: обработчик лишь кладёт строку, пишет и сбрасывает
+    # на диск фоновая задача — event-loop не блокируется на I/O
+    csv_queue: "asyncio.Queue[Tuple[GroupData, str]]" = asyncio.Queue()
+
+    async def csv_worker() -> None:
+        # flush не на каждую пачку, а по счётчику строк или по таймеру —
+        # иначе при редких сообщениях он снова превращается в «на каждую строку»
+        pending: Set[GroupData] = set()
+        rows_since_flush = 0
+        while True:
+            try:
+                item = await asyncio.wait_for(csv_queue.get(), timeout=CSV_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                for g in pending:
+                    g.csv_writer.flush()
+                pending.clear()
+                rows_since_flush = 0
+                continue
+            batch = [item]
+            while not csv_queue.empty():
+                batch.append(csv_queue.get_nowait())
+            for g, line in batch:
+                g.csv_writer.write(line)
+                pending.add(g)
+            rows_since_flush += len(batch)
+            if rows_since_flush >= CSV_FLUSH_ROWS:
+                for g in pending:
+                    g.csv_writer.flush()
+                pending.clear()
+                rows_since_flush = 0
+
     # ――――――――― handler ――――――――― #
-    async def on_new_message(event: events.NewMessage.Event) -> None:
+    async def on_new_message(
+        event: events.NewMessage.Event,
+        *,
+        # глобальные имена горячего пути, привязанные как локальные:
+        # LOAD_FAST вместо LOAD_GLOBAL на каждом сообщении
+        _find_keyword=find_keyword,
+        _utc_now_iso=utc_now_iso,
+        _csv_line=csv_line,
+    ) -> None:
         msg = event.message
-        chat = await event.get_chat()
+        # id чата есть прямо в событии — сам объект чата (и возможный RPC
+        # за ним) понадобится только при совпадении, для построения ссылки
+        chat_id = event.chat_id
+
+        # целевые чаты не слушаем вовсе — O(1) проверка по множеству
+        if chat_id in target_ids:
+            return
 
         # смотрим, подходит ли чат к какому-нибудь из настроенных
-        g: Optional[GroupData] = next((x for x in groups if x.target_chat_id and chat.id), None)
+        g: Optional[GroupData] = group_by_source.get(chat_id) or catch_all
         if g is None:
             return
 
         # фильтр дубликатов
-        if not dup_cache.add(chat.id, msg.id):
+        if not dup_cache.add(chat_id, msg.id):
             return
 
-        # не реагируем на собственные уведомления, чтобы не зациклиться
-        if msg.out and msg.to_id and getattr(msg.to_id, "channel_id", None) == g.target_chat_id:
-            return
+        # нижний регистр считаем один раз — и для ключей, и для стоп-слов
+        text_lc = (msg.message or "").lower()
 
-        kw_alias = find_keyword(msg.message or "", g.keywords)
+        # стоп-слова проверяем до поиска ключей: дешёвый ранний отсев
+        # избавляет от полного скана по тексту
+        if g.excluded_pattern and g.excluded_pattern.search(text_lc):
+            kw_alias = None
+        else:
+            kw_alias = _find_keyword(text_lc, g)
         if kw_alias:
+            chat = await get_chat_cached(event)
             link = tg_link(chat, msg.id)
             anchor = (
-                f'<a href="{link}">Открыть сообщение</a>' if link != "—" else "Ссылка недоступна"
-            )
-            text = (
-                f"🚨 Найдено совпадение по адресу:\n<b>{kw_alias}</b>\n"
-                f"Оригинал сообщения:\n"
-                f"{msg.message}\n"
-                f"{anchor}"
+                ANCHOR_TMPL.format(link=link) if link != "—" else "Ссылка недоступна"
             )
+            text = MATCH_TMPL.format(kw=kw_alias, text=msg.message, anchor=anchor)
 
             try:
                 await bot_client.send_message(
@@ -206,23 +434,26 @@ async def main() -> None:
 
         # логируем всё, если задан csv_file
         if g.csv_writer:
-            csv.writer(g.csv_writer).writerow(
-                [
-                    datetime.now(timezone.utc).isoformat(timespec="seconds"),
-                    chat.id,
-                    msg.id,
-                    (msg.message or "").replace("\n", " "),
-                ]
+            csv_queue.put_nowait(
+                (g, _csv_line(_utc_now_iso(), chat_id, msg.id, msg.message or ""))
             )
-            g.csv_writer.flush()
 
     user_client.add_event_handler(on_new_message, events.NewMessage)
+    csv_task = asyncio.create_task(csv_worker())  # noqa: F841 — держим ссылку
 
     logger.info("Парсер запущен, ждём сообщения…")
-    await user_client.run_until_disconnected()
+    try:
+        await user_client.run_until_disconnected()
+    finally:
+        # не теряем хвост буфера при остановке
+        for g in groups:
+            if g.csv_writer:
+                g.csv_writer.flush()
 
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        uvloop.install()
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):